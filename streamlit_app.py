@@ -3,8 +3,10 @@ import yfinance as yf
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+import re
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime
+from pathlib import Path
 
 st.set_page_config(
     page_title="Volatility Regime Analyzer",
@@ -12,9 +14,54 @@ st.set_page_config(
     layout="wide"
 )
 
+REGIMES = ['Low', 'Medium', 'High']
+MAX_PLOT_POINTS = 2000
+CACHE_DIR = Path('.yfcache')
+CACHEABLE_TICKER = re.compile(r'[A-Z0-9.^=-]+')
+
+
+def _cache_path(ticker, start_date):
+    if not CACHEABLE_TICKER.fullmatch(ticker):
+        return None
+    return CACHE_DIR / f'{ticker}_{start_date}.parquet'
+
+
+def read_cached_prices(ticker, start_date):
+    path = _cache_path(ticker, start_date)
+    if path is None:
+        return None
+    try:
+        if datetime.fromtimestamp(path.stat().st_mtime).date() != date.today():
+            return None
+        return pd.read_parquet(path)['Close']
+    except Exception:
+        return None
+
+
+def write_cached_prices(ticker, start_date, prices):
+    path = _cache_path(ticker, start_date)
+    if path is None:
+        return prices
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        prices.to_frame().to_parquet(path)
+    except Exception:
+        pass
+    return prices
+
+
+def clear_disk_cache():
+    for path in CACHE_DIR.glob('*.parquet'):
+        path.unlink(missing_ok=True)
+
 
 @st.cache_data(ttl=21600)
 def load_data(ticker, start_date='2010-01-01', max_retries=3):
+    cached = read_cached_prices(ticker, start_date)
+    if cached is not None:
+        return cached
+    
+    ticker_obj = None
     for attempt in range(max_retries):
         try:
             if attempt > 0:
@@ -23,7 +70,8 @@ def load_data(ticker, start_date='2010-01-01', max_retries=3):
             else:
                 time.sleep(0.5)
             
-            ticker_obj = yf.Ticker(ticker)
+            if ticker_obj is None:
+                ticker_obj = yf.Ticker(ticker)
             data = ticker_obj.history(start=start_date)
             
             if data.empty:
@@ -31,13 +79,13 @@ def load_data(ticker, start_date='2010-01-01', max_retries=3):
                     try:
                         data = ticker_obj.history(period="5y")
                         if not data.empty:
-                            return data['Close']
+                            return write_cached_prices(ticker, start_date, data['Close'].astype('float32'))
                     except:
                         pass
                     continue
                 return None
             
-            return data['Close']
+            return write_cached_prices(ticker, start_date, data['Close'].astype('float32'))
             
         except Exception as e:
             error_msg = str(e).lower()
@@ -83,31 +131,77 @@ def load_data(ticker, start_date='2010-01-01', max_retries=3):
 
 
 def compute_returns(prices):
-    return np.log(prices / prices.shift(1)).dropna()
+    return np.diff(np.log(prices))
+
+
+def _rolling_std(values, window):
+    x = np.asarray(values, dtype=np.float64)
+    if len(x):
+        x = x - x.mean()
+    
+    sums = np.concatenate(([0.0], np.cumsum(x)))
+    sums_sq = np.concatenate(([0.0], np.cumsum(x * x)))
+    window_sum = sums[window:] - sums[:-window]
+    window_sum_sq = sums_sq[window:] - sums_sq[:-window]
+    variance = (window_sum_sq - window_sum * window_sum / window) / (window - 1)
+    
+    rolling_std = np.full(len(x), np.nan)
+    rolling_std[window - 1:] = np.sqrt(np.maximum(variance, 0.0))
+    return rolling_std.astype(values.dtype, copy=False)
 
 
 def compute_volatility(returns, window=30):
-    rolling_std = returns.rolling(window=window).std()
-    annualized_vol = rolling_std * np.sqrt(252)
+    annualized_vol = _rolling_std(returns, window)
+    annualized_vol *= np.sqrt(252)
     return annualized_vol
 
 
 def classify_regimes(volatility):
-    p33 = volatility.quantile(0.33)
-    p67 = volatility.quantile(0.67)
+    if np.isnan(volatility).all():
+        return np.full(len(volatility), -1, dtype=np.int8)
+    
+    thresholds = np.nanquantile(volatility, [0.33, 0.67])
+    
+    codes = np.searchsorted(thresholds, volatility, side='left')
+    codes[np.isnan(volatility)] = -1
+    return codes
+
+
+@st.cache_data(ttl=21600, show_spinner=False)
+def compute_regimes(prices, window=30):
+    prices = prices.dropna()
+    returns = compute_returns(prices.to_numpy())
+    volatility = compute_volatility(returns, window=window)
+    codes = classify_regimes(volatility)
+    
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=REGIMES, ordered=True),
+        index=prices.index[1:]
+    )
+
+
+def downsample_prices(prices, n_out=MAX_PLOT_POINTS):
+    if len(prices) <= n_out:
+        return prices
     
-    regimes = pd.Series(index=volatility.index, dtype='object')
-    regimes[volatility <= p33] = 'Low'
-    regimes[(volatility > p33) & (volatility <= p67)] = 'Medium'
-    regimes[volatility > p67] = 'High'
+    bin_size = -(-len(prices) // (n_out // 2))
+    n_bins = -(-len(prices) // bin_size)
+    values = np.full(n_bins * bin_size, np.nan)
+    values[:len(prices)] = prices.to_numpy()
+    bins = values.reshape(n_bins, bin_size)
+    offsets = np.arange(n_bins) * bin_size
     
-    return regimes
+    keep = np.concatenate((
+        [0, len(prices) - 1],
+        offsets + np.nanargmin(bins, axis=1),
+        offsets + np.nanargmax(bins, axis=1),
+    ))
+    return prices.iloc[np.unique(keep)]
 
 
 def plot_regimes(prices, regimes):
-    common_index = prices.index.intersection(regimes.index)
-    prices_aligned = prices.loc[common_index]
-    regimes_aligned = regimes.loc[common_index]
+    dates = regimes.index
+    prices_aligned = prices.loc[dates[0]:]
     
     fig = go.Figure()
     
@@ -117,40 +211,34 @@ def plot_regimes(prices, regimes):
         'High': 'rgba(255, 107, 107, 0.3)'
     }
     
-    dates_list = list(common_index)
-    current_regime = None
-    start_date = None
+    color_by_code = [regime_colors[regime] for regime in REGIMES]
     
-    for date in dates_list:
-        regime = regimes_aligned.loc[date]
-        
-        if pd.isna(regime):
-            continue
-            
-        if regime != current_regime:
-            if current_regime is not None and start_date is not None:
-                fig.add_vrect(
-                    x0=start_date,
-                    x1=date,
-                    fillcolor=regime_colors[current_regime],
-                    layer="below",
-                    line_width=0,
-                )
-            current_regime = regime
-            start_date = date
-    
-    if current_regime is not None and start_date is not None:
-        fig.add_vrect(
-            x0=start_date,
-            x1=dates_list[-1],
-            fillcolor=regime_colors[current_regime],
-            layer="below",
-            line_width=0,
+    codes = regimes.cat.codes.to_numpy()
+    change = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.append(change, len(codes) - 1)
+    
+    shapes = [
+        dict(
+            type='rect',
+            xref='x',
+            yref='paper',
+            x0=dates[start],
+            x1=dates[end],
+            y0=0,
+            y1=1,
+            fillcolor=color_by_code[codes[start]],
+            layer='below',
+            line=dict(width=0),
         )
+        for start, end in zip(starts, ends)
+        if codes[start] >= 0
+    ]
     
-    fig.add_trace(go.Scatter(
-        x=prices_aligned.index,
-        y=prices_aligned.values,
+    line = downsample_prices(prices_aligned)
+    fig.add_trace(go.Scattergl(
+        x=line.index,
+        y=line.values,
         mode='lines',
         name='Price',
         line=dict(color='black', width=2),
@@ -172,18 +260,20 @@ def plot_regimes(prices, regimes):
         plot_bgcolor='white',
         xaxis=dict(showgrid=True, gridcolor='lightgray', gridwidth=1),
         yaxis=dict(showgrid=True, gridcolor='lightgray', gridwidth=1),
+        shapes=shapes,
     )
     
     return fig
 
 
+@st.cache_data(ttl=21600, show_spinner=False)
 def get_regime_stats(regimes):
-    regime_counts = regimes.value_counts()
+    codes = regimes.cat.codes.to_numpy()
+    regime_counts = np.bincount(codes[codes >= 0], minlength=len(REGIMES))
     total_days = len(regimes)
     
     stats = {}
-    for regime in ['Low', 'Medium', 'High']:
-        count = regime_counts.get(regime, 0)
+    for regime, count in zip(REGIMES, regime_counts):
         stats[regime] = {
             'count': count,
             'percentage': (count / total_days) * 100 if total_days > 0 else 0
@@ -192,43 +282,34 @@ def get_regime_stats(regimes):
     return stats
 
 
+@st.cache_data(ttl=21600, show_spinner=False)
 def compute_transition_matrix(regimes):
-    regimes_clean = regimes.dropna()
-    if len(regimes_clean) < 2:
+    codes = regimes.cat.codes.to_numpy()
+    codes = codes[codes >= 0]
+    if len(codes) < 2:
         return None
     
-    current_regimes = regimes_clean[:-1].values
-    next_regimes = regimes_clean[1:].values
+    n = len(REGIMES)
+    counts = np.bincount(codes[:-1] * n + codes[1:], minlength=n * n).reshape(n, n)
+    row_sums = counts.sum(axis=1, keepdims=True)
     
-    transition_df = pd.DataFrame({
-        'From': current_regimes,
-        'To': next_regimes
-    })
-    
-    transition_matrix = pd.crosstab(
-        transition_df['From'],
-        transition_df['To'],
-        normalize='index'
-    )
-    
-    regime_order = ['Low', 'Medium', 'High']
-    transition_matrix = transition_matrix.reindex(
-        index=regime_order,
-        columns=regime_order,
-        fill_value=0
+    return pd.DataFrame(
+        counts / np.maximum(row_sums, 1),
+        index=pd.Index(REGIMES, name='From'),
+        columns=pd.Index(REGIMES, name='To')
     )
-    
-    return transition_matrix
 
 
 def plot_transition_heatmap(transition_matrix):
+    text_matrix = [[f'{value:.1%}' for value in row] for row in transition_matrix.values]
+    
     fig = go.Figure(data=go.Heatmap(
         z=transition_matrix.values,
         x=transition_matrix.columns,
         y=transition_matrix.index,
         colorscale='Blues',
-        text=transition_matrix.values,
-        texttemplate='%{text:.1%}',
+        text=text_matrix,
+        texttemplate='%{text}',
         textfont={"size": 14},
         colorbar=dict(title="Probability", tickformat='.0%')
     ))
@@ -249,6 +330,89 @@ def plot_transition_heatmap(transition_matrix):
     return fig
 
 
+@st.cache_resource(ttl=21600, show_spinner=False)
+def build_price_fig(ticker, window):
+    prices = load_data(ticker=ticker)
+    regimes = compute_regimes(prices, window=window)
+    return plot_regimes(prices, regimes)
+
+
+@st.cache_resource(ttl=21600, show_spinner=False)
+def build_transition_fig(ticker, window):
+    prices = load_data(ticker=ticker)
+    transition_matrix = compute_transition_matrix(compute_regimes(prices, window=window))
+    if transition_matrix is None:
+        return None
+    return plot_transition_heatmap(transition_matrix)
+
+
+def render_analysis(ticker, window):
+    status_placeholder = st.empty()
+    
+    with status_placeholder.container():
+        with st.spinner(f"Loading data for {ticker}..."):
+            prices = load_data(ticker=ticker)
+    
+    status_placeholder.empty()
+    
+    if prices is None or prices.empty:
+        st.error(
+            f"⚠️ **Could not load data for {ticker}**\n\n"
+            "This could be due to:\n"
+            "- Rate limiting (please wait 1-2 minutes and try again)\n"
+            "- Invalid ticker symbol\n"
+            "- Network connectivity issues\n\n"
+            "💡 **Tip:** The app caches data for 6 hours. If you just tried multiple tickers, "
+            "wait a moment before trying again."
+        )
+        return
+    
+    regimes = compute_regimes(prices, window=window)
+    
+    stats = get_regime_stats(regimes)
+    
+    st.markdown(f"### Statistics for {ticker}")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            "Low Volatility",
+            f"{stats['Low']['count']} days"
+        )
+    with col2:
+        st.metric(
+            "Medium Volatility",
+            f"{stats['Medium']['count']} days"
+        )
+    with col3:
+        st.metric(
+            "High Volatility",
+            f"{stats['High']['count']} days"
+        )
+    
+    st.plotly_chart(build_price_fig(ticker, window), use_container_width=True)
+    
+    st.markdown("---")
+    st.markdown("### Regime Transition Matrix")
+    
+    heatmap_fig = build_transition_fig(ticker, window)
+    
+    if heatmap_fig is not None:
+        st.plotly_chart(heatmap_fig, use_container_width=True)
+        
+        st.caption(
+            "Transition probabilities show how likely each regime is to persist or change. "
+            "Higher values on the diagonal indicate regime persistence, while off-diagonal values "
+            "show transition likelihoods between different volatility states."
+        )
+    else:
+        st.info("Insufficient data to compute transition matrix.")
+    
+    st.markdown("---")
+    st.caption(f"Data range: {prices.index[0].strftime('%Y-%m-%d')} to {prices.index[-1].strftime('%Y-%m-%d')} | "
+              f"Total trading days: {len(prices)} | "
+              f"Rolling window: {window} days")
+
+
 def main():
     st.sidebar.header("Settings")
     
@@ -268,6 +432,8 @@ def main():
     st.sidebar.markdown("---")
     if st.sidebar.button("Refresh Data", help="Clear cache and reload data from Yahoo Finance"):
         st.cache_data.clear()
+        st.cache_resource.clear()
+        clear_disk_cache()
         st.sidebar.success("Cache cleared! Data will be reloaded.")
         st.rerun()
     
@@ -284,74 +450,7 @@ def main():
     """)
     
     if ticker:
-        status_placeholder = st.empty()
-        
-        with status_placeholder.container():
-            with st.spinner(f"Loading data for {ticker}..."):
-                prices = load_data(ticker=ticker)
-        
-        status_placeholder.empty()
-        
-        if prices is None or prices.empty:
-            st.error(
-                f"⚠️ **Could not load data for {ticker}**\n\n"
-                "This could be due to:\n"
-                "- Rate limiting (please wait 1-2 minutes and try again)\n"
-                "- Invalid ticker symbol\n"
-                "- Network connectivity issues\n\n"
-                "💡 **Tip:** The app caches data for 6 hours. If you just tried multiple tickers, "
-                "wait a moment before trying again."
-            )
-            return
-        
-        returns = compute_returns(prices)
-        volatility = compute_volatility(returns, window=window)
-        regimes = classify_regimes(volatility)
-        
-        stats = get_regime_stats(regimes)
-        
-        st.markdown(f"### Statistics for {ticker}")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(
-                "Low Volatility",
-                f"{stats['Low']['count']} days"
-            )
-        with col2:
-            st.metric(
-                "Medium Volatility",
-                f"{stats['Medium']['count']} days"
-            )
-        with col3:
-            st.metric(
-                "High Volatility",
-                f"{stats['High']['count']} days"
-            )
-        
-        fig = plot_regimes(prices, regimes)
-        st.plotly_chart(fig, use_container_width=True)
-        
-        st.markdown("---")
-        st.markdown("### Regime Transition Matrix")
-        
-        transition_matrix = compute_transition_matrix(regimes)
-        
-        if transition_matrix is not None:
-            heatmap_fig = plot_transition_heatmap(transition_matrix)
-            st.plotly_chart(heatmap_fig, use_container_width=True)
-            
-            st.caption(
-                "Transition probabilities show how likely each regime is to persist or change. "
-                "Higher values on the diagonal indicate regime persistence, while off-diagonal values "
-                "show transition likelihoods between different volatility states."
-            )
-        else:
-            st.info("Insufficient data to compute transition matrix.")
-        
-        st.markdown("---")
-        st.caption(f"Data range: {prices.index[0].strftime('%Y-%m-%d')} to {prices.index[-1].strftime('%Y-%m-%d')} | "
-                  f"Total trading days: {len(prices)} | "
-                  f"Rolling window: {window} days")
+        render_analysis(ticker, window)
 
 
 if __name__ == "__main__":
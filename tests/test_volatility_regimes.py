@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from volatility_regimes import _rolling_std, compute_panel_volatility
+
+
+def _returns(n, k=None, seed=0):
+    shape = (n,) if k is None else (n, k)
+    return np.random.default_rng(seed).normal(0, 0.01, shape)
+
+
+def test_rolling_std_matches_pandas_with_interior_gap():
+    returns = _returns(300)
+    returns[150] = np.nan
+    
+    expected = pd.Series(returns).rolling(30).std().to_numpy()
+    result = _rolling_std(returns, 30)
+    
+    np.testing.assert_allclose(result, expected, rtol=1e-9, equal_nan=True)
+    assert np.isfinite(result).sum() == np.isfinite(expected).sum()
+
+
+def test_rolling_std_matches_pandas_on_gapped_columns():
+    returns = _returns(300, 2)
+    returns[:50, 1] = np.nan
+    returns[200, 0] = np.nan
+    
+    expected = pd.DataFrame(returns).rolling(30).std().to_numpy()
+    result = _rolling_std(returns, 30)
+    
+    np.testing.assert_allclose(result, expected, rtol=1e-9, equal_nan=True)
+    assert np.isfinite(result[:, 1]).sum() == 221
+
+
+def test_rolling_std_all_missing_column():
+    returns = _returns(100, 2)
+    returns[:, 1] = np.nan
+    
+    result = _rolling_std(returns, 30)
+    
+    assert np.isnan(result[:, 1]).all()
+    assert np.isfinite(result[29:, 0]).all()
+
+
+def test_panel_volatility_handles_late_listing():
+    index = pd.date_range('2020-01-01', periods=200, freq='B')
+    closes = pd.DataFrame(
+        100 * np.exp(np.cumsum(_returns(200, 2, seed=1), axis=0)),
+        index=index,
+        columns=['SPY', 'NEW'],
+    )
+    closes.iloc[:60, 1] = np.nan
+    
+    expected = np.log(closes).diff().iloc[1:].rolling(30).std() * np.sqrt(252)
+    result = compute_panel_volatility(closes, window=30)
+    
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-9)
@@ -1,79 +1,135 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
+from dataclasses import dataclass
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
+
+REGIMES = ['Low', 'Medium', 'High']
+CACHE_DIR = Path('outputs') / 'cache'
+
+
+@dataclass
+class PricePanel:
+    dates: pd.DatetimeIndex
+    close: np.ndarray
+
+
+def download_prices(tickers=('SPY',), start_date='2010-01-01'):
+    tickers = list(tickers)
+    label = ', '.join(tickers)
+    cache_path = CACHE_DIR / f"{'_'.join(tickers)}_{start_date}_close.parquet"
+    if (cache_path.exists()
+            and datetime.fromtimestamp(cache_path.stat().st_mtime).date() == date.today()):
+        print(f"Loading cached {label} data from {cache_path}...")
+        closes = pd.read_parquet(cache_path)
+    else:
+        print(f"Downloading {label} data from {start_date} to present...")
+        import yfinance as yf
+        data = yf.download(tickers, start=start_date, auto_adjust=True,
+                           threads=True, progress=False)
+        
+        if data.empty:
+            raise ValueError("No data downloaded. Check date range and ticker symbol.")
+        
+        closes = data['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        closes.to_parquet(cache_path)
+    
+    return closes.dropna(how='all').astype(np.float32)
 
 
-def download_spy_data(start_date='2010-01-01'):
-    print(f"Downloading SPY data from {start_date} to present...")
-    ticker = yf.Ticker("SPY")
-    data = ticker.history(start=start_date)
-    
-    if data.empty:
-        raise ValueError("No data downloaded. Check date range and ticker symbol.")
-    
-    return data['Close']
+def load_price_panel(ticker='SPY', start_date='2010-01-01'):
+    prices = download_prices((ticker,), start_date=start_date)[ticker].dropna()
+    return PricePanel(dates=prices.index, close=prices.to_numpy())
 
 
-def compute_log_returns(prices):
-    return np.log(prices / prices.shift(1)).dropna()
+def compute_log_returns(close):
+    return np.diff(np.log(close), axis=0)
+
+
+def _rolling_std(values, window):
+    x = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(x)
+    nobs = valid.sum(axis=0)
+    x = x - np.nansum(x, axis=0) / np.maximum(nobs, 1)
+    
+    zeros = np.zeros((1,) + x.shape[1:])
+    sums = np.concatenate((zeros, np.nancumsum(x, axis=0)))
+    sums_sq = np.concatenate((zeros, np.nancumsum(x * x, axis=0)))
+    counts = np.concatenate((zeros, np.cumsum(valid, axis=0)))
+    window_sum = sums[window:] - sums[:-window]
+    window_sum_sq = sums_sq[window:] - sums_sq[:-window]
+    window_nobs = counts[window:] - counts[:-window]
+    variance = (window_sum_sq - window_sum * window_sum / window) / (window - 1)
+    
+    rolling_std = np.full(x.shape, np.nan)
+    rolling_std[window - 1:] = np.where(
+        window_nobs == window, np.sqrt(np.maximum(variance, 0.0)), np.nan
+    )
+    return rolling_std.astype(values.dtype, copy=False)
 
 
 def compute_rolling_volatility(returns, window=30):
-    rolling_std = returns.rolling(window=window).std()
-    annualized_vol = rolling_std * np.sqrt(252)
+    annualized_vol = _rolling_std(returns, window)
+    annualized_vol *= np.sqrt(252)
     return annualized_vol
 
 
+def compute_panel_volatility(closes, window=30):
+    returns = compute_log_returns(closes.to_numpy())
+    volatility = compute_rolling_volatility(returns, window=window)
+    return pd.DataFrame(volatility, index=closes.index[1:], columns=closes.columns)
+
+
 def classify_volatility_regimes(volatility):
-    p33 = volatility.quantile(0.33)
-    p67 = volatility.quantile(0.67)
+    missing = np.isnan(volatility)
+    if missing.all():
+        return np.full(len(volatility), -1, dtype=np.int8)
     
-    regimes = pd.Series(index=volatility.index, dtype='object')
-    regimes[volatility <= p33] = 'Low'
-    regimes[(volatility > p33) & (volatility <= p67)] = 'Medium'
-    regimes[volatility > p67] = 'High'
+    thresholds = np.quantile(volatility[~missing], [0.33, 0.67])
     
-    return regimes
+    codes = np.digitize(volatility, thresholds, right=True).astype(np.int8)
+    codes[missing] = -1
+    return codes
 
 
-def plot_volatility_regimes(prices, regimes, output_dir='outputs'):
+def compute_regime_codes(returns, window=30):
+    return classify_volatility_regimes(_rolling_std(returns, window))
+
+
+def plot_volatility_regimes(panel, codes, output_dir='outputs', dpi=120, fmt='png'):
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+    import matplotlib.dates as mdates
+    from matplotlib.collections import PolyCollection
+    
     fig, ax = plt.subplots(figsize=(14, 8))
     
-    common_index = prices.index.intersection(regimes.index)
-    prices_aligned = prices.loc[common_index]
-    regimes_aligned = regimes.loc[common_index]
+    offset = len(panel.close) - len(codes)
+    regime_dates = panel.dates[offset:]
     
-    ax.plot(prices_aligned.index, prices_aligned.values, 
+    ax.plot(regime_dates, panel.close[offset:], 
             color='black', linewidth=1.5, label='SPY Price', zorder=3)
     
     regime_colors = {'Low': '#90EE90', 'Medium': '#FFD700', 'High': '#FF6B6B'}
     
-    dates_list = list(common_index)
-    current_regime = None
-    start_idx = 0
+    color_by_code = [regime_colors[regime] for regime in REGIMES]
     
-    for i, date in enumerate(dates_list):
-        regime = regimes_aligned.loc[date]
-        
-        if pd.isna(regime):
-            continue
-            
-        if regime != current_regime:
-            if current_regime is not None and i > start_idx:
-                ax.axvspan(dates_list[start_idx], date, 
-                          color=regime_colors[current_regime], 
-                          alpha=0.3, zorder=0)
-            current_regime = regime
-            start_idx = i
-    
-    if current_regime is not None and start_idx < len(dates_list):
-        ax.axvspan(dates_list[start_idx], dates_list[-1], 
-                  color=regime_colors[current_regime], 
-                  alpha=0.3, zorder=0)
+    change_idx = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], change_idx))
+    ends = np.append(change_idx, len(codes) - 1)
+    
+    x = mdates.date2num(regime_dates)
+    runs = [(start, end) for start, end in zip(starts, ends) if codes[start] >= 0]
+    shading = PolyCollection(
+        [[(x[start], 0), (x[end], 0), (x[end], 1), (x[start], 1)] for start, end in runs],
+        facecolors=[color_by_code[codes[start]] for start, _ in runs],
+        alpha=0.3, zorder=0, transform=ax.get_xaxis_transform()
+    )
+    ax.add_collection(shading, autolim=False)
     
     ax.set_xlabel('Date', fontsize=12, fontweight='bold')
     ax.set_ylabel('SPY Price (USD)', fontsize=12, fontweight='bold')
@@ -90,44 +146,61 @@ def plot_volatility_regimes(prices, regimes, output_dir='outputs'):
     ax.legend(handles=legend_elements, loc='upper left', fontsize=10)
     
     plt.xticks(rotation=45)
-    plt.tight_layout()
+    fig.subplots_adjust(left=0.08, right=0.98, top=0.93, bottom=0.15)
     
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
-    filename = output_path / 'spy_volatility_regimes.png'
-    plt.savefig(filename, dpi=300, bbox_inches='tight')
+    filename = output_path / f'spy_volatility_regimes.{fmt}'
+    plt.savefig(filename, dpi=dpi)
     print(f"\nFigure saved to: {filename}")
     
     plt.close()
 
 
-def print_summary_statistics(regimes):
+def print_summary_statistics(codes):
     print("\n" + "="*50)
     print("Volatility Regime Summary Statistics")
     print("="*50)
     
-    regime_counts = regimes.value_counts()
-    total_days = len(regimes)
+    regime_counts = np.bincount(codes[codes >= 0], minlength=len(REGIMES))
+    total_days = len(codes)
     
-    for regime in ['Low', 'Medium', 'High']:
-        count = regime_counts.get(regime, 0)
+    for regime, count in zip(REGIMES, regime_counts):
         percentage = (count / total_days) * 100
         print(f"{regime:10s} Volatility: {count:5d} days ({percentage:5.2f}%)")
     
     print("="*50 + "\n")
 
 
-def main():
-    prices = download_spy_data(start_date='2010-01-01')
+def run_pipeline(start_date='2010-01-01', window=30):
+    cache_path = CACHE_DIR / f'pipeline_SPY_{start_date}_{window}.parquet'
+    if (cache_path.exists()
+            and datetime.fromtimestamp(cache_path.stat().st_mtime).date() == date.today()):
+        print(f"Loading cached regimes from {cache_path}...")
+        cached = pd.read_parquet(cache_path)
+        panel = PricePanel(dates=cached.index, close=cached['close'].to_numpy())
+        return panel, cached['regime_code'].to_numpy()[1:]
     
-    returns = compute_log_returns(prices)
-    volatility = compute_rolling_volatility(returns, window=30)
+    panel = load_price_panel('SPY', start_date=start_date)
     
-    regimes = classify_volatility_regimes(volatility)
+    returns = compute_log_returns(panel.close)
+    codes = compute_regime_codes(returns, window=window)
+    
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(
+        {'close': panel.close, 'regime_code': np.concatenate(([-1], codes)).astype(np.int8)},
+        index=panel.dates
+    ).to_parquet(cache_path)
+    
+    return panel, codes
+
+
+def main():
+    panel, codes = run_pipeline(start_date='2010-01-01', window=30)
     
-    print_summary_statistics(regimes)
+    print_summary_statistics(codes)
     
-    plot_volatility_regimes(prices, regimes, output_dir='outputs')
+    plot_volatility_regimes(panel, codes, output_dir='outputs')
     
     print("Analysis complete!")
 